@@ -2,15 +2,84 @@
 # Connects to tiingo.com to get financial instruments data
 # https://github.com/enriam
 
+import asyncio
+import hashlib
+import json
+import logging
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Sequence, TypeVar, Union
+import numpy as np
 import pandas as pd
-from datetime import date
-from io import StringIO
+from datetime import date, datetime, timedelta, timezone
+from io import BytesIO
+from pathlib import Path
+
+try:  # optional, enables concurrent requests in get_stock_historical
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:  # optional, enables http/2 requests in get_stock_historical
+    import httpx
+except ImportError:
+    httpx = None
+try:  # optional, http/2 protocol used by httpx
+    import h2
+except ImportError:
+    h2 = None
+try:  # optional, faster csv parsing and arrow backed dataframes
+    import pyarrow
+except ImportError:
+    pyarrow = None
+try:  # optional, enables brotli compressed responses
+    import brotli
+except ImportError:
+    brotli = None
+try:  # optional, faster json parsing
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 JSON = TypeVar("JSON")  # used for json type hint
 
+logger = logging.getLogger(__name__)
+
+# tokens already accepted by tiingo, not validated again
+_validated_tokens = set()
+
+# max number of requests sent to tiingo at the same time
+PARALLEL_REQUESTS = 10
+
+# retries for rate limited (429) or failed (5xx) requests, waiting
+# RETRY_BACKOFF * 2 ** attempt seconds unless tiingo sends Retry-After
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# compressed responses accepted from tiingo, brotli needs a decoder
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+
+
+@lru_cache(maxsize=512)
+def _is_valid_iso_date(str_date):
+    """Check if date string is a valid ISO format, results are cached since
+    the same dates are usually checked over and over"""
+    # empty string is valid
+    if str_date == "":
+        return True
+    # validate ISO format
+    try:
+        date.fromisoformat(str_date)
+    except (TypeError, ValueError):
+        return False
+    else:
+        return True
+
 
 class TiingoError(Exception):
     """Wrapper for TiingoClient exceptions."""
@@ -18,6 +87,58 @@ class TiingoError(Exception):
     pass
 
 
+class FileCache:
+    """On-disk cache for tiingo historical data, stored as parquet files.
+
+    Each ticker and query (frequency and columns) is kept under
+    {path}/{endpoint}/{md5(query)}.parquet, next to a json file with the
+    date range it covers, so that only missing dates need to be requested.
+    Entries are considered stale once they are older than the endpoint's
+    ttl (seconds). Requires pyarrow or fastparquet.
+    """
+
+    # default time to live by endpoint, in seconds
+    _default_ttl = {
+        "eod": 86400,  # end of day data
+        "iex": 3600,  # intraday data
+    }
+
+    def __init__(self, path="~/.tiingo_cache", ttl=None):
+        self.path = Path(path).expanduser()
+        self.ttl = {**self._default_ttl, **(ttl or {})}
+
+    def __repr__(self):
+        return f"<FileCache({self.path})>"
+
+    def _file(self, endpoint, query):
+        """Returns the path of the file holding the data for query"""
+        key = hashlib.md5(query.encode()).hexdigest()
+        return self.path / endpoint / f"{key}.parquet"
+
+    def get(self, endpoint, query):
+        """Returns a tuple (dataframe, info) with cached data and a dict
+        with its date range ('start', 'end') and creation time, or None
+        if missing or stale"""
+        file = self._file(endpoint, query)
+        # missing or damaged entries are a miss, data is requested again
+        try:
+            info = json_loads(file.with_suffix(".json").read_bytes())
+            if time.time() - info["created"] >= self.ttl[endpoint]:
+                return None
+            return pd.read_parquet(file), info
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, endpoint, query, df, start, end, created=None):
+        """Stores dataframe holding data for query between start and end
+        dates. Creation time is kept when extending an existing entry"""
+        file = self._file(endpoint, query)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(file)
+        info = {"start": start, "end": end, "created": created or time.time()}
+        file.with_suffix(".json").write_text(json.dumps(info))
+
+
 class TiingoRESTClient:
     """REST client used to connect and retrieve data from tiingo.com"""
 
@@ -70,98 +191,331 @@ class TiingoRESTClient:
         "askSize",
         "askPrice",
     )
+    # valid column names by endpoint, for fast lookups
+    _valid_cols = {
+        "eod": frozenset(_tii_eod_cols),
+        "iex_last": frozenset(_tii_iex_last_cols),
+        "iex_hist": frozenset(_tii_iex_hist_cols),
+    }
+
+    # --- COLUMN TYPES
+    # historical price columns, parsed without type inference
+    _tii_price_dtypes = dict.fromkeys(
+        (
+            "open",
+            "high",
+            "low",
+            "close",
+            "adjOpen",
+            "adjHigh",
+            "adjLow",
+            "adjClose",
+            "divCash",
+            "splitFactor",
+        ),
+        "float64",
+    )
+
+    # --- QUERY LIMITS
+    # max number of tickers per request for last price data
+    _tii_last_chunk_size = 50
 
     # --- RESAMPLE FREQUENCIES
     # fixed frequencies (eod endpoint)
     _tii_resample_freqs = ("daily", "weekly", "monthly", "annually")
     # pattern frequencies (iex endpoint)
-    _tii_resample_pattern = "\A^[0-9]+(min|hour)\Z"
+    _tii_resample_re = re.compile(r"\A[0-9]+(min|hour)\Z")
 
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        cache: FileCache = None,
+        validate_token: bool = True,
+        http2: bool = False,
+        arrow_dtypes: bool = False,
+    ):
+        # optional cache for historical data
+        self._cache = cache
+        # optional http/2 transport for historical data
+        if http2 and (httpx is None or h2 is None):
+            raise TiingoError(
+                "http2 requires httpx and h2, install them with: "
+                'pip install "httpx[http2]"'
+            )
+        self._http2 = http2
+        # historical data is parsed with pyarrow when available, optionally
+        # returning arrow backed dataframes
+        if arrow_dtypes and pyarrow is None:
+            raise TiingoError(
+                "arrow_dtypes requires pyarrow, install it with: "
+                "pip install pyarrow"
+            )
+        self._arrow_dtypes = arrow_dtypes
         self._tii_headers = {
             "Content-Type": "application/json",
             "Authorization": "Token " + str(token),
+            "Accept-Encoding": ACCEPT_ENCODING,
         }
-        # validate token
-        r = requests.get(
-            f"https://api.tiingo.com/api/test?token={token}",
-            headers=self._tii_headers,
-        ).json()
-        if r["message"] == "Auth Token was not correct":
-            raise TiingoError(
-                f'Tiingo rejected Auth Token "{token}".\n'
-                f"Tiingo response: {r}"
-            )
+        # persistent session, reuses connections between requests
+        self._session = requests.Session()
+        self._session.headers.update(self._tii_headers)
+        retry = Retry(
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=20, pool_maxsize=20
+        )
+        self._session.mount("https://", adapter)
+        # validate token, only once per token
+        if validate_token and token not in _validated_tokens:
+            r = self._session.get(
+                f"https://api.tiingo.com/api/test?token={token}"
+            ).json()
+            if r["message"] == "Auth Token was not correct":
+                self.close()
+                raise TiingoError(
+                    f'Tiingo rejected Auth Token "{token}".\n'
+                    f"Tiingo response: {r}"
+                )
+            _validated_tokens.add(token)
 
     def __repr__(self):
         return f"<TiingoRESTClient(https://api.tiingo.com)>"
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes the session and its connections"""
+        self._session.close()
+
     # --- Tools
     def _is_valid_date(self, str_date):
         """Check if date string is a valid ISO format"""
-        # empty string is valid
-        if str_date == "":
-            return True
-        # validate ISO format
-        try:
-            date.fromisoformat(str_date)
-        except:
+        # only strings are valid (and hashable by the cached check)
+        if not isinstance(str_date, str):
             return False
-        else:
-            return True
+        return _is_valid_iso_date(str_date)
+
+    def _missing_ranges(self, start, end, cached_start, cached_end):
+        """Returns the list of (start, end) date ranges not covered by
+        cached data. Gaps between the cached range and the requested one
+        are included so that cached data remains a continuous range"""
+        day = timedelta(days=1)
+        ranges = []
+        if start < cached_start:
+            before = date.fromisoformat(cached_start) - day
+            ranges.append((start, before.isoformat()))
+        if end > cached_end:
+            after = date.fromisoformat(cached_end) + day
+            ranges.append((after.isoformat(), end))
+        return ranges
 
     def _validate_cols(self, endpoint, columns):
         """Returns a list with only valid column names"""
 
         # identify set of valid names based on endpoint
-        if endpoint == "eod":
-            valid_names = self._tii_eod_cols
-        elif endpoint == "iex_last":
-            valid_names = self._tii_iex_last_cols
-        elif endpoint == "iex_hist":
-            valid_names = self._tii_iex_hist_cols
-        else:
-            print(
-                f"WARNING: could not proceed with column names validation. "
-                + "Wil return all available columns from Tiingo."
+        valid_names = self._valid_cols.get(endpoint)
+        if valid_names is None:
+            logger.warning(
+                "Could not proceed with column names validation. "
+                "Will return all available columns from Tiingo."
             )
             return []
 
         # select and return only valid column names
-        valid_columns = []
-        for column in columns:
-            if column in valid_names:
-                valid_columns.append(column)
-            else:
-                print(
-                    f'WARNING: column name "{column}" is invalid and '
-                    + "was removed from list of columns."
-                )
+        valid_columns = [c for c in columns if c in valid_names]
+        if len(valid_columns) < len(columns):
+            logger.warning(
+                "Dropped invalid columns: %s",
+                [c for c in columns if c not in valid_names],
+            )
         return valid_columns
 
-    def _build_pre_query(self, endpoint, columns, start, end, resample):
-        """Builds a pre query that will not work until word 'ticker'
-        is replaced by real ticker"""
+    def _read_prices(self, body):
+        """Reads historical prices in csv format into a dataframe indexed
+        by date (not parsed yet)"""
+        if pyarrow is None:
+            return pd.read_csv(
+                BytesIO(body), index_col="date", dtype=self._tii_price_dtypes
+            )
+
+        # pyarrow infers types on its own (pandas doesn't apply dtype
+        # reliably with this engine) -> make sure prices are float even if
+        # all values happen to be whole numbers
+        backend = {"dtype_backend": "pyarrow"} if self._arrow_dtypes else {}
+        px = pd.read_csv(
+            BytesIO(body), index_col="date", engine="pyarrow", **backend
+        )
+        ints = [
+            c
+            for c in px.columns
+            if c in self._tii_price_dtypes
+            and pd.api.types.is_integer_dtype(px[c])
+        ]
+        if ints:
+            float_type = "double[pyarrow]" if self._arrow_dtypes else "float64"
+            px[ints] = px[ints].astype(float_type)
+        return px
+
+    def _stack_frames(self, tickers, frames):
+        """Stacks dataframes with the same columns into a single dataframe
+        indexed by ticker and date, filling preallocated arrays"""
+        pairs = [(t, f) for t, f in zip(tickers, frames) if not f.empty]
+        columns = pairs[0][1].columns if pairs else None
+        if columns is None or any(
+            not f.columns.equals(columns)
+            or not all(isinstance(t, np.dtype) for t in f.dtypes)
+            for _, f in pairs
+        ):
+            # nothing to stack, mixed columns or arrow types -> let pandas
+            # align them
+            return pd.concat(frames, keys=tickers, names=["ticker"])
+
+        tickers, frames = zip(*pairs)
+        counts = [len(f) for f in frames]
+        index = pd.MultiIndex.from_arrays(
+            [
+                np.repeat(np.array(tickers, dtype=object), counts),
+                frames[0].index.append([f.index for f in frames[1:]]),
+            ],
+            names=["ticker", frames[0].index.name],
+        )
+
+        # group columns by type, each group is filled into one preallocated
+        # block (usually a single float block)
+        groups = {}
+        for column in columns:
+            dtype = np.result_type(*(f[column].dtype for f in frames))
+            groups.setdefault(dtype, []).append(column)
+        blocks = {
+            dtype: np.empty((len(index), len(group)), dtype=dtype)
+            for dtype, group in groups.items()
+        }
+        offset = 0
+        for f, count in zip(frames, counts):
+            for dtype, group in groups.items():
+                block = blocks[dtype]
+                for i, column in enumerate(group):
+                    block[offset : offset + count, i] = f[column].to_numpy()
+            offset += count
+
+        # single block -> wrap it without copying
+        if len(blocks) == 1:
+            (block,) = blocks.values()
+            return pd.DataFrame(
+                block, index=index, columns=columns, copy=False
+            )
+        data = {
+            column: blocks[dtype][:, i]
+            for dtype, group in groups.items()
+            for i, column in enumerate(group)
+        }
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    def _chunks(self, seq, size):
+        """Splits a sequence into lists of at most size elements"""
+        return [seq[i : i + size] for i in range(0, len(seq), size)]
+
+    def _build_pre_query(self, columns, start, end, resample):
+        """Builds the part of the query that follows the ticker, the full
+        query is endpoint + ticker + pre query"""
 
         # define query components
-        format = "format=json"  # so far this is not a user option
+        format = "format=csv"  # so far this is not a user option
         cols = "&columns=" + ",".join(columns) if columns else ""
         freq = "&resampleFreq=" + resample
         start_date = "&startDate=" + start if start else ""
         end_date = "&endDate=" + end if end else ""
 
         # build and return pre query
-        return (
-            f"{endpoint}ticker/prices?{format}"
-            f"{freq}{cols}{start_date}{end_date}"
-        )
+        return f"/prices?{format}{freq}{cols}{start_date}{end_date}"
+
+    def _fetch_all(self, urls):
+        """Returns (status, body) of every url, requests are sent
+        concurrently when aiohttp is available or http2 is enabled"""
+        if not urls:
+            return []
+        if aiohttp is None and not self._http2:
+            # fall back to sequential requests
+            return [
+                (r.status_code, r.content)
+                for r in (self._session.get(url) for url in urls)
+            ]
+        coro = self._fetch_all_async(urls)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # an event loop is already running (e.g. jupyter), so it can't be
+        # reused from sync code -> run the requests in a worker thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+
+    async def _fetch_all_async(self, urls):
+        """Sends all requests concurrently through a single client, using
+        httpx over http/2 when enabled or aiohttp otherwise"""
+        semaphore = asyncio.Semaphore(PARALLEL_REQUESTS)
+        if self._http2:
+            # requests are multiplexed over a single connection
+            client = httpx.AsyncClient(
+                http2=True,
+                headers=self._tii_headers,
+                limits=httpx.Limits(
+                    max_connections=PARALLEL_REQUESTS,
+                    max_keepalive_connections=PARALLEL_REQUESTS,
+                ),
+            )
+
+            async def get(url):
+                response = await client.get(url)
+                return response.status_code, response.headers, response.content
+
+        else:
+            client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=PARALLEL_REQUESTS, ttl_dns_cache=300
+                ),
+                headers=self._tii_headers,
+            )
+
+            async def get(url):
+                async with client.get(url) as response:
+                    return (
+                        response.status,
+                        response.headers,
+                        await response.read(),
+                    )
+
+        async def fetch(url):
+            async with semaphore:
+                for attempt in range(RETRY_TOTAL + 1):
+                    status, headers, body = await get(url)
+                    if status not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                        return status, body
+                    # wait as requested by tiingo or back off
+                    retry_after = headers.get("Retry-After")
+                    if retry_after and retry_after.isdigit():
+                        await asyncio.sleep(int(retry_after))
+                    else:
+                        await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
+
+        async with client:
+            return await asyncio.gather(*(fetch(url) for url in urls))
 
     # --- Methods
     def get_stock_metadata(self, ticker: str) -> JSON:
         """Returns ticker metadata in json format"""
         tii_request = f"{self._tii_eod}{ticker}"
-        r = requests.get(tii_request, headers=self._tii_headers)
-        return r.json()
+        r = self._session.get(tii_request)
+        return json_loads(r.content)
 
     def get_stock_historical(
         self,
@@ -170,8 +524,10 @@ class TiingoRESTClient:
         start: str = "",
         end: str = "",
         columns: Sequence[str] = [],
+        force_refresh: bool = False,
     ) -> pd.DataFrame:
-        """Returns a dataframe with historical data for all tickers"""
+        """Returns a dataframe with historical data for all tickers.
+        Cached data is ignored and replaced if force_refresh is True"""
 
         # --- Data Validation
         # tickers
@@ -179,12 +535,14 @@ class TiingoRESTClient:
             tickers = [tickers]
         # resample frequency and column names
         # case 1: iex data
-        if re.match(self._tii_resample_pattern, frequency):
+        if self._tii_resample_re.match(frequency):
             end_point = self._tii_iex
+            cache_endpoint = "iex"
             valid_columns = self._validate_cols("iex_hist", columns)
         # case 2: eod data
         elif frequency in self._tii_resample_freqs:
             end_point = self._tii_eod
+            cache_endpoint = "eod"
             valid_columns = self._validate_cols("eod", columns)
         # case 3: wrong data
         else:
@@ -200,35 +558,129 @@ class TiingoRESTClient:
         if not self._is_valid_date(start) or not self._is_valid_date(end):
             err_msg = f'Invalid date format. Valid format is: "YYYY-MM-DD"'
             raise TiingoError(err_msg)
+        # normalise to YYYY-MM-DD, dates are compared as strings below
+        start = date.fromisoformat(start).isoformat() if start else ""
+        end = date.fromisoformat(end).isoformat() if end else ""
 
         # --- Data Retrieval
-        # build pre query (instead of ticker value will have 'ticker' literal)
-        tii_request = self._build_pre_query(
-            end_point, valid_columns, start, end, frequency
-        )
+        # build pre query (query without endpoint and ticker) without
+        # dates, used to identify cached data
+        tii_query = self._build_pre_query(valid_columns, "", "", frequency)
+        # data is cached only when there is a start date, otherwise tiingo
+        # returns just the latest prices
+        use_cache = self._cache is not None and start != ""
+        if use_cache:
+            end = end or date.today().isoformat()
+            # data after the last fully published day (yesterday, UTC) may
+            # still change, so it's never marked as cached and is always
+            # requested again
+            yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+            covered_end = min(end, yesterday.isoformat())
+        # look up cached data and list date ranges to request per ticker,
+        # only tickers and dates missing from cache are requested
+        cached = {}
+        queries = []
+        for ticker in tickers:
+            ranges = [(start, end)]
+            if use_cache and not force_refresh:
+                entry = self._cache.get(
+                    cache_endpoint, end_point + ticker + tii_query
+                )
+                if entry is not None:
+                    cached[ticker] = entry
+                    ranges = self._missing_ranges(
+                        start, end, entry[1]["start"], entry[1]["end"]
+                    )
+            for range_start, range_end in ranges:
+                tii_request = self._build_pre_query(
+                    valid_columns, range_start, range_end, frequency
+                )
+                queries.append((ticker, end_point + ticker + tii_request))
+        # request data for all tickers and dates at once
+        responses = self._fetch_all([url for _, url in queries])
+        # convert to dataframes, grouped by ticker
+        received = {ticker: [] for ticker in tickers}
+        failed = {}
+        # bind names used in the loop to locals, avoids repeated lookups
+        read_prices = self._read_prices
+        to_datetime = pd.to_datetime
+        for (ticker, url), (status, body) in zip(queries, responses):
+            # failed requests are never read (nor cached) as empty data
+            if not 200 <= status < 300:
+                failed[ticker] = f"{status} {body.decode(errors='replace')}"
+                continue
+            try:
+                if body.strip():
+                    px = read_prices(body)
+                    # tiingo dates are always ISO 8601, skip format inference.
+                    # pyarrow may return arrow timestamps (intraday), the
+                    # index is always numpy backed
+                    px.index = pd.DatetimeIndex(
+                        to_datetime(
+                            px.index, format="ISO8601", utc=True, cache=True
+                        ),
+                        name="date",
+                    )
+                else:
+                    px = pd.DataFrame()
+            # unreadable data: parser and arrow errors are ValueErrors, the C
+            # parser raises TypeError when there is no date column
+            except (ValueError, KeyError, TypeError):
+                failed[ticker] = body.decode(errors="replace")
+            else:
+                received[ticker].append(px)
+        if failed:
+            logger.warning(
+                "Requests for %s returned an error and were removed from "
+                "list of tickers.\nTiingo responses:\n%s",
+                [ticker.upper() for ticker in failed],
+                "\n".join(f"{t.upper()}: {r}" for t, r in failed.items()),
+            )
+
         # create list to hold dataframes
         data = []
         # create list to hold valid tickers (don't get error from tiingo)
         valid_tickers = []
-        # request data, open a session for higher performance
-        with requests.Session() as s:
-            s.headers.update(self._tii_headers)
-            for ticker in tickers:
-                # send request using ticker values
-                r = s.get(tii_request.replace("ticker", ticker))
-                # convert to dataframe and add to dataframe list
-                try:
-                    px = pd.read_json(StringIO(r.text))
-                except:
-                    print(
-                        f'WARNING: request for "{ticker.upper()}" returned '
-                        + "an error and was removed from list of tickers."
-                        f"\nTiingo response: {r.json()}\n"
-                    )
-                else:
-                    px.set_index("date", inplace=True)
-                    valid_tickers.append(ticker)
-                    data.append(px)
+        data_append = data.append
+        valid_tickers_append = valid_tickers.append
+        for ticker in tickers:
+            if ticker in failed:
+                continue
+            # merge cached and received data
+            frames = received[ticker]
+            if ticker in cached:
+                frames = [cached[ticker][0]] + frames
+            frames = [frame for frame in frames if not frame.empty]
+            if len(frames) == 0:
+                px = pd.DataFrame()
+            elif len(frames) == 1:
+                px = frames[0]
+            else:
+                px = pd.concat(frames).sort_index()
+                px = px[~px.index.duplicated(keep="last")]
+            # store in cache along with the date range it covers
+            if use_cache:
+                if received[ticker]:
+                    query = end_point + ticker + tii_query
+                    if ticker in cached:
+                        info = cached[ticker][1]
+                        self._cache.set(
+                            cache_endpoint,
+                            query,
+                            px,
+                            min(start, info["start"]),
+                            max(covered_end, info["end"]),
+                            info["created"],
+                        )
+                    elif covered_end >= start:
+                        self._cache.set(
+                            cache_endpoint, query, px, start, covered_end
+                        )
+                if not px.empty:
+                    px = px.loc[start:end]
+            # add to dataframe list
+            valid_tickers_append(ticker)
+            data_append(px)
 
         # --- Dataframe composition
         # case 1: list of dataframes is empty -> return empty dataframe
@@ -237,13 +689,25 @@ class TiingoRESTClient:
         # case 2: there is only one dataframe -> return it
         elif len(data) == 1:
             df = data[0]
-        # case 3: several dataframes with only one column -> concat axis = 1
+        # case 3: several dataframes with only one column -> one column
+        # per ticker
         elif len(columns) == 1:
-            df = pd.concat(data, axis=1, names=["ticker"])
-            df.columns = valid_tickers
-        # case 4: several dataframes with several columns -> concat axis = 0
+            # tickers without data get an empty column, its index matches
+            # the other tickers' so the date index keeps its name and type
+            empty_index = next(
+                (px.index[:0] for px in data if len(px.columns)),
+                pd.DatetimeIndex([], tz="UTC", name="date"),
+            )
+            empty = pd.Series(dtype="float64", index=empty_index)
+            df = pd.DataFrame(
+                {
+                    ticker: px.iloc[:, 0] if len(px.columns) else empty
+                    for ticker, px in zip(valid_tickers, data)
+                }
+            )
+        # case 4: several dataframes with several columns -> stack them
         else:
-            df = pd.concat(data, keys=valid_tickers, names=["ticker"])
+            df = self._stack_frames(valid_tickers, data)
 
         return df
 
@@ -257,9 +721,13 @@ class TiingoRESTClient:
             tickers = [tickers]
 
         # --- Build query
-        # tickers
-        tickers_str = ",".join(tickers)
-        http_req = f"{self._tii_iex}?tickers={tickers_str}&format=csv"
+        # tickers are sent in chunks to keep urls within length limits, no
+        # tickers is a single request for all of them
+        chunks = self._chunks(tickers, self._tii_last_chunk_size) or [[]]
+        http_reqs = [
+            f"{self._tii_iex}?tickers={','.join(chunk)}&format=csv"
+            for chunk in chunks
+        ]
 
         # columns
         #   Note: the following functionality (specifiying several columns
@@ -270,9 +738,16 @@ class TiingoRESTClient:
         )
         if valid_columns:
             columns_str = ",".join(valid_columns)
-            http_req += f"&columns={columns_str}"
+            http_reqs = [f"{req}&columns={columns_str}" for req in http_reqs]
 
         # --- Request data
-        r = requests.get(http_req, headers=self._tii_headers)
-        px = pd.read_csv(StringIO(r.text), index_col="ticker")
+        if len(http_reqs) == 1:
+            responses = [self._session.get(http_reqs[0])]
+        else:
+            with ThreadPoolExecutor(PARALLEL_REQUESTS) as executor:
+                responses = list(executor.map(self._session.get, http_reqs))
+        px = pd.concat(
+            pd.read_csv(BytesIO(r.content), index_col="ticker")
+            for r in responses
+        )
         return px